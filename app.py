@@ -8,18 +8,56 @@ Web打印服务 - 基于Python Flask + CUPS
 from flask import Flask, render_template, request, jsonify, send_from_directory, Response
 from werkzeug.utils import secure_filename
 import os
+import pathlib
 import subprocess
+import shutil
 import json
+import re
+import traceback
 import uuid
 from datetime import datetime
+from urllib.parse import unquote
 import threading
+import concurrent.futures
+import queue
 import time
 import logging
 import sys
+import socket
+import atexit
+import hashlib
+import tempfile
+from collections import OrderedDict, deque
+
+# 导入unoserver客户端（常驻LibreOffice转换服务）
+try:
+    from unoserver.client import UnoClient
+    UNOSERVER_AVAILABLE = True
+except ImportError:
+    UNOSERVER_AVAILABLE = False
+    logging.warning("unoserver不可用，文档转换将回退到每次启动LibreOffice进程")
+
+# 导入redis客户端（多进程部署时共享打印任务状态）
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+# 导入pycups（通过cupsd的本地socket查询打印机，无需启动lpstat进程）
+try:
+    import cups
+    CUPS_AVAILABLE = True
+except ImportError:
+    CUPS_AVAILABLE = False
+    logging.warning("pycups不可用，将通过lpstat命令查询打印机URI")
+
+# 检查libreoffice是否可用（启动时检查一次）
+HAS_LIBREOFFICE = shutil.which('libreoffice') is not None
 
 # 导入IPP客户端
 try:
-    from ipp_client import IPPTOOL_AVAILABLE
+    from ipp_client import IPPTOOL_AVAILABLE, get_ink_info_via_ipptool, get_tray_info_via_ipptool
 except ImportError:
     IPPTOOL_AVAILABLE = False
     logging.warning("IPP客户端不可用，墨盒信息将返回模拟数据")
@@ -32,12 +70,40 @@ html_cache = {}
 app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(__file__), 'uploads')
 app.config['PREVIEW_FOLDER'] = os.path.join(os.path.dirname(__file__), 'previews')
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB最大文件
-app.config['ALLOWED_EXTENSIONS'] = {'pdf', 'txt', 'doc', 'docx', 'ppt', 'pptx', 'xls', 'xlsx', 'rtf', 'jpg', 'jpeg', 'png', 'gif', 'bmp', 'svg'}
+app.config['UPLOAD_CHUNK_SIZE'] = 1024 * 1024  # 流式上传每次读取1MB
+app.config['REDIS_URL'] = os.environ.get('REDIS_URL')  # 设置后打印任务状态保存到Redis
+app.config['JOB_TTL'] = 25 * 60 * 60  # Redis中任务记录的过期时间（略长于24小时清理周期）
+app.config['PRINTER_URI_CACHE_TTL'] = 60  # 打印机URI缓存60秒
+app.config['PREVIEW_CACHE_MAX_BYTES'] = 500 * 1024 * 1024  # 预览缓存最大占用500MB
+# LibreOffice常驻服务配置
+app.config['LIBREOFFICE_HOST'] = '127.0.0.1'
+app.config['LIBREOFFICE_UNO_PORT'] = 2202  # soffice UNO socket端口
+app.config['LIBREOFFICE_PORT'] = 2203  # unoserver XML-RPC端口
+app.config['LIBREOFFICE_PROFILE'] = '/tmp/lo-profile-webprint'  # LibreOffice用户配置目录
+app.config['LIBREOFFICE_TIMEOUT'] = 30  # 单个文档转换超时（秒）
+app.config['LIBREOFFICE_MAX_PARALLEL'] = 2  # 允许同时进行的转换数
+app.config['LIBREOFFICE_BATCH_WINDOW'] = 0.15  # 命令行转换合并等待时间（秒）
+app.config['LIBREOFFICE_BATCH_SIZE'] = 10  # 单次命令行转换的最大文件数
+
+# 文件扩展名分类
+IMAGE_EXTS = frozenset({'jpg', 'jpeg', 'png', 'gif', 'bmp', 'svg'})
+DOC_EXTS = frozenset({'txt', 'doc', 'docx', 'ppt', 'pptx', 'xls', 'xlsx', 'rtf'})
+ALL_EXTS = IMAGE_EXTS | DOC_EXTS | {'pdf'}
+
+app.config['ALLOWED_EXTENSIONS'] = ALL_EXTS
 
 # 确保上传目录和预览目录存在
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['PREVIEW_FOLDER'], exist_ok=True)
 
+# 解析后的基础目录（启动时解析一次，供路径安全检查使用）
+_UPLOADS = pathlib.Path(app.config['UPLOAD_FOLDER']).resolve()
+_PREVIEWS = pathlib.Path(app.config['PREVIEW_FOLDER']).resolve()
+_RESOLVED_BASES = {
+    app.config['UPLOAD_FOLDER']: _UPLOADS,
+    app.config['PREVIEW_FOLDER']: _PREVIEWS
+}
+
 # 配置日志（使用本地日志路径）
 logging.basicConfig(
     level=logging.INFO,
@@ -49,9 +115,262 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+class MemoryJobStore:
+    """进程内的打印任务存储（单进程部署使用）"""
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()  # 线程锁保护共享数据
+
+    def create(self, job_id, job):
+        with self._lock:
+            self._jobs[job_id] = dict(job)
+
+    def get(self, job_id):
+        """获取任务记录副本，不存在返回None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def update_if(self, job_id, statuses, **fields):
+        """任务状态为statuses之一时才更新，返回是否已更新"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job or job.get('status') not in statuses:
+                return False
+            job.update(fields)
+            return True
+
+    def append_message(self, job_id, text):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id]['message'] = (self._jobs[job_id].get('message') or '') + text
+
+    def delete(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def values(self):
+        with self._lock:
+            return [dict(job) for job in self._jobs.values()]
+
+    def __contains__(self, job_id):
+        with self._lock:
+            return job_id in self._jobs
+
+    def __len__(self):
+        with self._lock:
+            return len(self._jobs)
+
+
+class RedisJobStore:
+    """
+    基于Redis的打印任务存储
+
+    每个任务保存为哈希 job:<id>（字段值为JSON），并记录在集合 jobs 中，
+    多个gunicorn工作进程共享任务状态，服务重启后状态不丢失。
+    任务变化时向 job_events 频道发布任务ID，便于推送状态更新。
+    """
+
+    EVENTS_CHANNEL = 'job_events'
+    INDEX_KEY = 'jobs'
+
+    # 任务存在（且状态符合预期）时才写入字段，检查和写入在Redis中原子执行，
+    # 避免任务在两步之间过期后被重新创建为没有过期时间的残缺记录，
+    # 也保证多个工作进程中只有一个能完成同一次状态转换
+    # KEYS[1]: 任务键；ARGV: 频道、任务ID、预期状态列表（JSON，空列表不检查）、字段1、值1...
+    UPDATE_SCRIPT = """
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        return 0
+    end
+    local statuses = cjson.decode(ARGV[3])
+    if #statuses > 0 then
+        local status = redis.call('HGET', KEYS[1], 'status')
+        local matched = false
+        for _, expected in ipairs(statuses) do
+            if status == expected then
+                matched = true
+            end
+        end
+        if not matched then
+            return 0
+        end
+    end
+    for i = 4, #ARGV, 2 do
+        redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+    end
+    redis.call('PUBLISH', ARGV[1], ARGV[2])
+    return 1
+    """
+
+    # 在消息末尾追加文本，读取和写入原子执行，并发追加时不会互相覆盖
+    # KEYS[1]: 任务键；ARGV: 频道、任务ID、追加的文本
+    APPEND_MESSAGE_SCRIPT = """
+    local raw = redis.call('HGET', KEYS[1], 'message')
+    if not raw then
+        return 0
+    end
+    local message = cjson.decode(raw)
+    if type(message) ~= 'string' then
+        message = ''
+    end
+    redis.call('HSET', KEYS[1], 'message', cjson.encode(message .. ARGV[3]))
+    redis.call('PUBLISH', ARGV[1], ARGV[2])
+    return 1
+    """
+
+    def __init__(self, url, ttl):
+        self.ttl = ttl
+        self.client = redis.Redis(
+            connection_pool=redis.ConnectionPool.from_url(url, max_connections=32)
+        )
+        self._update = self.client.register_script(self.UPDATE_SCRIPT)
+        self._append_message = self.client.register_script(self.APPEND_MESSAGE_SCRIPT)
+
+    @staticmethod
+    def _key(job_id):
+        return f"job:{job_id}"
+
+    @staticmethod
+    def _decode(raw):
+        return {
+            field.decode(): json.loads(value)
+            for field, value in raw.items()
+        }
+
+    def create(self, job_id, job):
+        key = self._key(job_id)
+        pipe = self.client.pipeline()
+        pipe.hset(key, mapping={field: json.dumps(value) for field, value in job.items()})
+        pipe.expire(key, self.ttl)
+        pipe.sadd(self.INDEX_KEY, job_id)
+        pipe.publish(self.EVENTS_CHANNEL, job_id)
+        pipe.execute()
+
+    def get(self, job_id):
+        """获取任务记录，不存在返回None"""
+        raw = self.client.hgetall(self._key(job_id))
+        return self._decode(raw) if raw else None
+
+    def update(self, job_id, **fields):
+        self.update_if(job_id, (), **fields)
+
+    def update_if(self, job_id, statuses, **fields):
+        """任务状态为statuses之一时才更新（statuses为空时不检查），返回是否已更新"""
+        # 字段值以JSON保存，预期状态也按JSON编码后比较
+        args = [self.EVENTS_CHANNEL, job_id, json.dumps([json.dumps(status) for status in statuses])]
+        for field, value in fields.items():
+            args += [field, json.dumps(value)]
+        return bool(self._update(keys=[self._key(job_id)], args=args))
+
+    def append_message(self, job_id, text):
+        self._append_message(
+            keys=[self._key(job_id)],
+            args=[self.EVENTS_CHANNEL, job_id, text]
+        )
+
+    def delete(self, job_id):
+        pipe = self.client.pipeline()
+        pipe.delete(self._key(job_id))
+        pipe.srem(self.INDEX_KEY, job_id)
+        pipe.execute()
+
+    def values(self):
+        job_ids = [job_id.decode() for job_id in self.client.smembers(self.INDEX_KEY)]
+        pipe = self.client.pipeline()
+        for job_id in job_ids:
+            pipe.hgetall(self._key(job_id))
+
+        jobs = []
+        expired = []
+        for job_id, raw in zip(job_ids, pipe.execute()):
+            if raw:
+                jobs.append(self._decode(raw))
+            else:
+                expired.append(job_id)
+
+        # 移除已过期任务的索引
+        if expired:
+            self.client.srem(self.INDEX_KEY, *expired)
+        return jobs
+
+    def __contains__(self, job_id):
+        return bool(self.client.exists(self._key(job_id)))
+
+    def __len__(self):
+        return self.client.scard(self.INDEX_KEY)
+
+
+def create_job_store():
+    """根据配置创建打印任务存储，配置了REDIS_URL时使用Redis"""
+    redis_url = app.config['REDIS_URL']
+    if redis_url:
+        if REDIS_AVAILABLE:
+            logger.info("打印任务状态保存到Redis")
+            return RedisJobStore(redis_url, app.config['JOB_TTL'])
+        logger.warning("已配置REDIS_URL但redis客户端不可用，打印任务状态保存在进程内存中")
+    return MemoryJobStore()
+
+
 # 存储打印任务状态
-print_jobs = {}
-print_jobs_lock = threading.Lock()  # 添加线程锁保护共享数据
+print_jobs = create_job_store()
+
+# lpstat -v 输出中的设备行，如 "device for PrinterName: ipp://192.168.1.100/ipp/print"
+_DEVICE_RE = re.compile(r'device\s+for\s+(\S+?):\s*(\S+)')
+
+# 页面范围格式，如 "1", "1-5", "1-5,8", "1-5,8,10-12"
+_PAGE_RANGE_RE = re.compile(r'^(\d+(-\d+)?)(,\s*\d+(-\d+)?)*$')
+
+# 后台短任务线程池（预览预生成、服务启动等），避免为每个任务创建线程
+EXECUTOR_MAX_WORKERS = (os.cpu_count() or 1) * 2
+EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+    max_workers=EXECUTOR_MAX_WORKERS,
+    thread_name_prefix='webprint'
+)
+# 线程池中排队和正在执行的任务数（供 /api/status 查看积压情况）
+executor_tasks = {'queued': 0, 'active': 0}
+executor_tasks_lock = threading.Lock()
+
+# 正在监控进度的打印任务（任务ID -> 监控信息），由单个监控线程轮询
+active_monitors = {}
+active_monitors_lock = threading.Lock()
+monitor_wakeup = threading.Event()
+
+# 打印任务优先级队列，元素为 (优先级, 入队时间, 任务ID)，数值越小越优先，
+# 优先级相同时按入队时间先后处理
+JOB_QUEUE = queue.PriorityQueue()
+DEFAULT_JOB_PRIORITY = 5
+
+# 打印任务分发线程池，单线程按优先级依次提交到CUPS
+PRINT_EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+    max_workers=1,
+    thread_name_prefix='webprint-print'
+)
+
+# 限制同时占用线程池的文档转换任务数，避免CPU密集的转换挤占其他任务
+CONVERSION_SLOTS = threading.BoundedSemaphore(app.config['LIBREOFFICE_MAX_PARALLEL'])
+active_conversions = 0
+active_conversions_lock = threading.Lock()
+
+# 打印机URI缓存（打印机名称 -> URI），整张表一次查询得到，共用一个缓存时间
+printer_uri_cache = {}
+printer_uri_cache_time = 0
+printer_uri_cache_lock = threading.Lock()
+# 保证同一时间只有一个线程在刷新URI缓存，其余线程等待后直接使用刷新结果
+printer_uri_refresh_lock = threading.Lock()
+
+# pycups连接（复用同一连接，非线程安全，需加锁使用）
+cups_connection = None
+cups_connection_lock = threading.Lock()
+
+# 上传文件名 -> 内容哈希（预览缓存键）
+upload_keys = {}
+upload_keys_lock = threading.Lock()
 
 
 def is_safe_path(base_path, target_path):
@@ -65,17 +384,21 @@ def is_safe_path(base_path, target_path):
     Returns:
         bool: 安全返回True，不安全返回False
     """
-    # 规范化路径，解析所有符号链接和相对路径
-    base_abs = os.path.abspath(base_path)
-    target_abs = os.path.abspath(target_path)
+    # 解析所有符号链接和相对路径，常用基础目录使用启动时解析的结果
+    try:
+        base_resolved = _RESOLVED_BASES.get(base_path) or pathlib.Path(base_path).resolve()
+        target_resolved = pathlib.Path(target_path).resolve()
+    except (ValueError, OSError):
+        # 路径中含有NUL字节等非法字符，或无法解析（如符号链接循环）
+        return False
 
-    # 检查目标路径是否以基础路径开头
-    return target_abs.startswith(base_abs + os.sep) or target_abs == base_abs
+    # 检查目标路径是否位于基础路径内（按路径组成部分比较，而非字符串前缀）
+    return target_resolved.is_relative_to(base_resolved)
 
 
 def get_printer_uri(printer_name):
     """
-    获取打印机URI
+    获取打印机URI（从缓存的URI表中查找，有效期 PRINTER_URI_CACHE_TTL 秒）
 
     Args:
         printer_name: 打印机名称
@@ -83,9 +406,100 @@ def get_printer_uri(printer_name):
     Returns:
         打印机URI字符串，如果失败返回None
     """
+    device_uris = get_device_uris()
+    if device_uris is None:
+        return None
+    return device_uris.get(printer_name)
+
+
+def get_device_uris():
+    """
+    获取所有打印机的device URI（带缓存），缓存过期时重新查询一次
+
+    Returns:
+        {打印机名称: device URI}，查询失败返回None
+    """
+    def cached_uris():
+        with printer_uri_cache_lock:
+            if time.time() - printer_uri_cache_time < app.config['PRINTER_URI_CACHE_TTL']:
+                return dict(printer_uri_cache)
+        return None
+
+    device_uris = cached_uris()
+    if device_uris is not None:
+        return device_uris
+
+    with printer_uri_refresh_lock:
+        # 等待期间其他线程可能已完成刷新
+        device_uris = cached_uris()
+        if device_uris is not None:
+            return device_uris
+        return refresh_printer_uris()
+
+
+def invalidate_printer_uri(printer_name=None):
+    """使打印机URI缓存失效，下次查询时重新获取所有打印机的URI"""
+    global printer_uri_cache_time
+
+    with printer_uri_cache_lock:
+        if printer_name is None:
+            printer_uri_cache.clear()
+        else:
+            printer_uri_cache.pop(printer_name, None)
+        printer_uri_cache_time = 0
+
+
+def parse_device_uris(output):
+    """
+    解析 lpstat -v 输出
+
+    Returns:
+        {打印机名称: device URI}
+    """
+    device_uris = {}
+    for match in _DEVICE_RE.finditer(output):
+        device_uris.setdefault(match.group(1), match.group(2))
+    return device_uris
+
+
+def query_cups_device_uris():
+    """
+    通过pycups查询所有打印机的device URI
+
+    Returns:
+        {打印机名称: device URI}，查询失败返回None
+    """
+    global cups_connection
+
+    with cups_connection_lock:
+        try:
+            if cups_connection is None:
+                cups_connection = cups.Connection()
+            printers = cups_connection.getPrinters()
+        except Exception as e:
+            # 连接可能因cupsd重启失效，下次重新建立
+            cups_connection = None
+            logger.warning(f"通过pycups获取打印机信息失败: {e}")
+            return None
+
+    return {name: attrs.get('device-uri') for name, attrs in printers.items()}
+
+
+def query_device_uris():
+    """
+    查询所有打印机的device URI（一次查询），优先使用pycups，不可用时使用lpstat -v
+
+    Returns:
+        {打印机名称: device URI}，查询失败返回None
+    """
+    if CUPS_AVAILABLE:
+        device_uris = query_cups_device_uris()
+        if device_uris is not None:
+            return device_uris
+
     try:
         result = subprocess.run(
-            ['lpstat', '-p', printer_name, '-v'],
+            ['lpstat', '-v'],
             capture_output=True,
             text=True,
             timeout=5
@@ -95,15 +509,7 @@ def get_printer_uri(printer_name):
             logger.error(f"获取打印机URI失败: {result.stderr}")
             return None
 
-        printer_uri = None
-        for line in result.stdout.split('\n'):
-            import re
-            match = re.search(r'device\s+for\s+' + re.escape(printer_name) + r':\s*(\S+)', line)
-            if match:
-                printer_uri = match.group(1).strip()
-                break
-
-        return printer_uri
+        return parse_device_uris(result.stdout)
 
     except subprocess.TimeoutExpired:
         logger.error(f"获取打印机URI超时")
@@ -113,6 +519,26 @@ def get_printer_uri(printer_name):
         return None
 
 
+def refresh_printer_uris():
+    """
+    查询所有打印机URI并替换缓存
+
+    Returns:
+        {打印机名称: device URI}，查询失败返回None
+    """
+    global printer_uri_cache, printer_uri_cache_time
+
+    device_uris = query_device_uris()
+    # 只缓存成功的查询结果，失败时下次请求重新查询
+    if device_uris is None:
+        return None
+
+    with printer_uri_cache_lock:
+        printer_uri_cache = {name: uri for name, uri in device_uris.items() if uri}
+        printer_uri_cache_time = time.time()
+    return device_uris
+
+
 def get_safe_path(base_path, filename):
     """
     获取安全的文件路径，防止路径遍历攻击
@@ -162,40 +588,363 @@ def get_safe_path_with_subdirs(base_path, relative_path):
         logger.warning(f"检测到潜在的路径遍历攻击: {relative_path}")
         return None
 
+def _ext(filename):
+    """获取小写的文件扩展名，没有扩展名时返回空字符串"""
+    _, dot, ext = filename.rpartition('.')
+    return ext.lower() if dot else ''
+
 def allowed_file(filename):
     """检查文件扩展名是否允许"""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
+    return _ext(filename) in ALL_EXTS
 
 def is_image_file(filename):
     """检查是否为图片文件"""
-    image_extensions = {'jpg', 'jpeg', 'png', 'gif', 'bmp', 'svg'}
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in image_extensions
+    return _ext(filename) in IMAGE_EXTS
 
 def is_document_file(filename):
     """检查是否为文档文件（非PDF）"""
-    doc_extensions = {'txt', 'doc', 'docx', 'ppt', 'pptx', 'xls', 'xlsx', 'rtf'}
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in doc_extensions
+    return _ext(filename) in DOC_EXTS
 
 def get_file_type(filename):
     """获取文件类型分类"""
     if not filename:
         return 'unknown'
     
-    ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+    ext = _ext(filename)
     
-    if ext in ['pdf']:
+    if ext == 'pdf':
         return 'pdf'
-    elif ext in ['jpg', 'jpeg', 'png', 'gif', 'bmp', 'svg']:
+    elif ext in IMAGE_EXTS:
         return 'image'
-    elif ext in ['txt', 'doc', 'docx', 'ppt', 'pptx', 'xls', 'xlsx', 'rtf']:
+    elif ext in DOC_EXTS:
         return 'document'
     else:
         return 'other'
 
+class LibreOfficeService:
+    """
+    常驻LibreOffice转换服务
+
+    启动一个长期运行的unoserver（由它管理 soffice --headless --accept=socket...），
+    之后的文档转换都通过UnoClient交给该实例完成，避免每次转换都重新启动soffice。
+    使用独立的用户配置目录，防止转换请求被转交给其他已运行的LibreOffice实例。
+    """
+
+    # 启动失败后至少间隔多少秒再重试，避免反复启动失败的进程
+    restart_interval = 30
+
+    def __init__(self, host, port, uno_port, profile, max_parallel, conversion_timeout):
+        self.host = host
+        self.port = port
+        self.uno_port = uno_port
+        self.profile = profile
+        self.conversion_timeout = conversion_timeout
+        # 由本进程启动的unoserver；复用其他进程启动的服务时为None
+        self.process = None
+        self.ready = threading.Event()
+        # 限制同时进行的转换数，超出的请求排队等待
+        self.semaphore = threading.BoundedSemaphore(max_parallel)
+        # 命令行回退模式下共用同一配置目录，必须串行执行
+        self.cli_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._starting = False
+        self._retry_after = 0
+        # unoserver最近的输出，进程退出时写入错误日志便于排查
+        self._recent_output = deque(maxlen=20)
+
+    def _port_open(self):
+        """unoserver端口是否已有服务在监听"""
+        try:
+            with socket.create_connection((self.host, self.port), timeout=1):
+                return True
+        except OSError:
+            return False
+
+    def ensure_started(self):
+        """
+        确认常驻服务可用；不可用时在后台线程中（重新）启动服务
+
+        首次转换时才启动服务，避免每个导入本模块的进程（如调试模式下的重载父进程）
+        都启动一个unoserver。
+
+        Returns:
+            bool: 服务当前可用返回True，否则返回False（本次转换由调用方回退到命令行）
+        """
+        if self.is_running():
+            return True
+        if not UNOSERVER_AVAILABLE:
+            return False
+
+        with self._lock:
+            if self._starting or time.time() < self._retry_after:
+                return False
+            self._starting = True
+
+        threading.Thread(target=self.start, daemon=True, name='webprint-unoserver').start()
+        return False
+
+    def start(self, startup_timeout=60):
+        """启动unoserver进程并等待端口可用（在后台线程中调用）"""
+        try:
+            if self._port_open():
+                # 其他进程（如另一个worker）已在同一端口启动了服务，直接复用
+                self.process = None
+                self.ready.set()
+                logger.info(f"复用已运行的LibreOffice常驻服务: {self.host}:{self.port}")
+                return
+
+            cmd = [
+                'unoserver',
+                '--interface', self.host,
+                '--port', str(self.port),
+                '--uno-interface', self.host,
+                '--uno-port', str(self.uno_port),
+                '--user-installation', self.profile,
+                # 转换超时后由unoserver中止，避免卡住的文档一直占用转换名额
+                '--conversion-timeout', str(self.conversion_timeout)
+            ]
+            try:
+                process = subprocess.Popen(
+                    cmd,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.PIPE,
+                    text=True,
+                    errors='replace'
+                )
+            except FileNotFoundError:
+                logger.error("unoserver命令不存在，无法启动LibreOffice常驻服务")
+                return
+            self.process = process
+            self._recent_output.clear()
+            # unoserver的日志和错误信息都输出到stderr，转发到应用日志
+            threading.Thread(
+                target=self._forward_output,
+                args=(process,),
+                daemon=True,
+                name='webprint-unoserver-log'
+            ).start()
+
+            deadline = time.time() + startup_timeout
+            while time.time() < deadline:
+                if process.poll() is not None:
+                    # 可能是其他进程同时启动了服务并先占用了端口
+                    if self._port_open():
+                        self.process = None
+                        self.ready.set()
+                        logger.info(f"复用已运行的LibreOffice常驻服务: {self.host}:{self.port}")
+                        return
+                    logger.error(
+                        f"LibreOffice常驻服务启动失败，退出码: {process.returncode}\n"
+                        + self._output_tail(process)
+                    )
+                    return
+                if self._port_open():
+                    self.ready.set()
+                    logger.info(f"LibreOffice常驻服务已启动: {self.host}:{self.port}")
+                    return
+                time.sleep(0.5)
+
+            logger.error("LibreOffice常驻服务启动超时")
+            process.kill()
+        finally:
+            with self._lock:
+                if not self.ready.is_set():
+                    self._retry_after = time.time() + self.restart_interval
+                self._starting = False
+
+    def _forward_output(self, process):
+        """将unoserver进程的stderr逐行写入日志，直到进程退出"""
+        for line in process.stderr:
+            line = line.rstrip()
+            if line:
+                self._recent_output.append(line)
+                logger.info(f"unoserver: {line}")
+        process.stderr.close()
+
+    def _output_tail(self, process, timeout=2):
+        """等待输出转发完毕后返回unoserver最近的输出"""
+        # 进程已退出，转发线程读到EOF后关闭stderr
+        deadline = time.time() + timeout
+        while not process.stderr.closed and time.time() < deadline:
+            time.sleep(0.05)
+        return '\n'.join(self._recent_output) or '（无输出）'
+
+    def stop(self):
+        """停止由本进程启动的unoserver进程"""
+        self.ready.clear()
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+    def is_running(self):
+        """常驻服务是否可用（不会触发启动）"""
+        if not self.ready.is_set():
+            return False
+        if self.process is None:
+            # 复用其他进程的服务时，确认对方仍在监听
+            if self._port_open():
+                return True
+            self.ready.clear()
+            logger.warning("LibreOffice常驻服务已不可用，将重新启动")
+            return False
+        if self.process.poll() is not None:
+            self.ready.clear()
+            logger.warning(
+                f"LibreOffice常驻服务已退出（退出码: {self.process.returncode}），将重新启动\n"
+                + self._output_tail(self.process)
+            )
+            return False
+        return True
+
+    def convert(self, input_file, output_file):
+        """
+        通过常驻服务将文档转换为PDF
+
+        Returns:
+            bool: 输出文件生成成功返回True
+        """
+        with self.semaphore:
+            client = UnoClient(server=self.host, port=str(self.port))
+            client.convert(inpath=input_file, outpath=output_file, convert_to='pdf')
+        return os.path.exists(output_file)
+
+
+libreoffice_service = LibreOfficeService(
+    app.config['LIBREOFFICE_HOST'],
+    app.config['LIBREOFFICE_PORT'],
+    app.config['LIBREOFFICE_UNO_PORT'],
+    app.config['LIBREOFFICE_PROFILE'],
+    app.config['LIBREOFFICE_MAX_PARALLEL'],
+    app.config['LIBREOFFICE_TIMEOUT']
+)
+atexit.register(libreoffice_service.stop)
+
+class BatchingConverter:
+    """
+    命令行转换的批处理器（常驻服务不可用时使用）
+
+    短时间内到达的多个转换请求合并为一次 libreoffice --convert-to 调用，
+    分摊每次启动LibreOffice的开销。批次超时后逐个重试，单个文件失败不影响同批其他文件。
+    """
+
+    def __init__(self, window, max_batch, timeout=30):
+        self.window = window
+        self.max_batch = max_batch
+        self.timeout = timeout  # 单个文件的转换超时
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def convert(self, input_file, output_dir):
+        """
+        提交转换请求并等待结果
+
+        Returns:
+            转换后的PDF文件路径，如果失败返回None
+        """
+        item = {
+            'input': input_file,
+            'output_dir': output_dir,
+            'stem': os.path.splitext(os.path.basename(input_file))[0],
+            'result': None,
+            'done': threading.Event()
+        }
+
+        with self._lock:
+            self._pending.append(item)
+            full = len(self._pending) >= self.max_batch
+
+        # 等待一个时间窗口，收集同一批次的其他请求
+        if not full:
+            item['done'].wait(self.window)
+
+        while not item['done'].is_set():
+            with self._lock:
+                batch = self._take_batch(item) if item in self._pending else None
+            if batch:
+                self._run(batch)
+            else:
+                # 已被其他线程的批次取走，等待其完成
+                item['done'].wait()
+
+        return item['result']
+
+    def _take_batch(self, item):
+        """从待处理列表取出包含item的一个批次（调用方持有锁）"""
+        batch = [item]
+        stems = {item['stem']}
+        for other in self._pending:
+            if len(batch) >= self.max_batch:
+                break
+            # 输出文件名相同的请求不能放在同一批次
+            if other is not item and other['stem'] not in stems:
+                batch.append(other)
+                stems.add(other['stem'])
+
+        for taken in batch:
+            self._pending.remove(taken)
+        return batch
+
+    def _run(self, batch):
+        """执行一个批次的转换，并唤醒等待的请求"""
+        try:
+            with tempfile.TemporaryDirectory(prefix='webprint-convert-') as out_dir:
+                # 指定独立的用户配置目录，避免转换请求被转交给已运行的实例后直接返回0
+                cmd = [
+                    'libreoffice',
+                    f"-env:UserInstallation={pathlib.Path(app.config['LIBREOFFICE_PROFILE'] + '-cli').as_uri()}",
+                    '--headless',
+                    '--convert-to', 'pdf',
+                    '--outdir', out_dir
+                ] + [item['input'] for item in batch]
+
+                try:
+                    # 共用同一配置目录，必须串行执行
+                    with libreoffice_service.cli_lock:
+                        result = subprocess.run(
+                            cmd,
+                            capture_output=True,
+                            text=True,
+                            timeout=self.timeout * len(batch)
+                        )
+                except subprocess.TimeoutExpired:
+                    if len(batch) > 1:
+                        # 批次超时，逐个重试找出有问题的文件
+                        logger.warning(f"批量文档转换超时，逐个重试 {len(batch)} 个文件")
+                        for item in batch:
+                            self._run([item])
+                        return
+                    logger.error(f"文档转换超时: {batch[0]['input']}")
+                    return
+
+                for item in batch:
+                    pdf_path = os.path.join(out_dir, f"{item['stem']}.pdf")
+                    if not os.path.exists(pdf_path):
+                        logger.error(f"文档转换失败: {item['input']} {result.stderr}")
+                        continue
+                    dest = os.path.join(item['output_dir'], f"{item['stem']}.pdf")
+                    shutil.move(pdf_path, dest)
+                    item['result'] = dest
+        except Exception as e:
+            logger.error(f"批量文档转换失败: {e}")
+        finally:
+            for item in batch:
+                item['done'].set()
+
+
+batching_converter = BatchingConverter(
+    app.config['LIBREOFFICE_BATCH_WINDOW'],
+    app.config['LIBREOFFICE_BATCH_SIZE']
+)
+
 def convert_to_pdf(input_file, output_dir):
     """
     使用LibreOffice将文档转换为PDF
-    
+
+    优先使用常驻LibreOffice服务，服务不可用时回退到命令行转换
+
     Args:
         input_file: 输入文件路径
         output_dir: 输出目录
@@ -206,35 +955,24 @@ def convert_to_pdf(input_file, output_dir):
     try:
         filename = os.path.basename(input_file)
         name, ext = os.path.splitext(filename)
+        pdf_path = os.path.join(output_dir, f"{name}.pdf")
+
+        # 优先通过常驻服务转换
+        if libreoffice_service.ensure_started():
+            try:
+                if libreoffice_service.convert(input_file, pdf_path):
+                    return pdf_path
+                logger.warning("常驻LibreOffice服务未生成PDF，回退到命令行转换")
+            except Exception as e:
+                logger.warning(f"常驻LibreOffice服务转换失败，回退到命令行转换: {e}")
         
         # 检查libreoffice是否可用
-        try:
-            subprocess.run(['libreoffice', '--version'], 
-                         capture_output=True, timeout=5)
-        except (FileNotFoundError, subprocess.TimeoutExpired) as e:
+        if not HAS_LIBREOFFICE:
             logger.error("LibreOffice未安装或不可用")
             return None
         
-        # 使用libreoffice转换
-        cmd = [
-            'libreoffice',
-            '--headless',
-            '--convert-to', 'pdf',
-            '--outdir', output_dir,
-            input_file
-        ]
-        
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=30)
-        
-        if result.returncode == 0:
-            # 返回转换后的PDF路径
-            pdf_filename = f"{name}.pdf"
-            pdf_path = os.path.join(output_dir, pdf_filename)
-            if os.path.exists(pdf_path):
-                return pdf_path
-        
-        logger.error(f"文档转换失败: {result.stderr}")
-        return None
+        # 使用libreoffice命令行转换，与同时到达的其他请求合并为一批
+        return batching_converter.convert(input_file, output_dir)
     except FileNotFoundError:
         logger.error("LibreOffice未安装，无法转换文档")
         return None
@@ -245,6 +983,134 @@ def convert_to_pdf(input_file, output_dir):
         logger.error(f"文档转换失败: {e}")
         return None
 
+def compute_content_key(filepath):
+    """
+    计算文件内容哈希，作为预览缓存键
+
+    Args:
+        filepath: 文件路径
+
+    Returns:
+        str: 32位十六进制哈希
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def get_content_key(filename, filepath):
+    """获取上传文件的内容哈希，未记录时（如服务重启后）重新计算"""
+    with upload_keys_lock:
+        key = upload_keys.get(filename)
+    if key:
+        return key
+
+    key = compute_content_key(filepath)
+    with upload_keys_lock:
+        upload_keys[filename] = key
+    return key
+
+
+class PreviewCache:
+    """
+    预览PDF的磁盘LRU缓存
+
+    以文件内容哈希为键保存为 PREVIEW_FOLDER/<key>.pdf，相同内容的文件共用同一份预览，
+    总大小超过上限时淘汰最久未使用的预览文件。
+    """
+
+    def __init__(self, folder, max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> 文件大小，按最近使用排序
+        self.total_bytes = 0
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._load()
+
+    def _load(self):
+        """启动时按修改时间载入已有的预览文件"""
+        files = []
+        for filename in os.listdir(self.folder):
+            filepath = os.path.join(self.folder, filename)
+            if filename.endswith('.pdf') and os.path.isfile(filepath):
+                stat = os.stat(filepath)
+                files.append((stat.st_mtime, filename[:-4], stat.st_size))
+
+        for mtime, key, size in sorted(files):
+            self.entries[key] = size
+            self.total_bytes += size
+        self._evict()
+
+    def path_for(self, key):
+        return os.path.join(self.folder, f"{key}.pdf")
+
+    def lock_for(self, key):
+        """获取单个缓存键的锁，避免同一文件被并发重复转换"""
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def discard_lock(self, key):
+        """键未缓存时（如转换失败）移除它的锁，已缓存的键在淘汰时移除"""
+        with self._lock:
+            if key not in self.entries:
+                self._key_locks.pop(key, None)
+
+    def get(self, key):
+        """
+        查询缓存
+
+        Returns:
+            预览文件路径，未命中返回None
+        """
+        pdf_path = self.path_for(key)
+        with self._lock:
+            if key not in self.entries:
+                return None
+            if not os.path.exists(pdf_path):
+                self.total_bytes -= self.entries.pop(key)
+                return None
+            self.entries.move_to_end(key)
+        # 更新修改时间，重启后仍能保持LRU顺序
+        try:
+            os.utime(pdf_path)
+        except OSError:
+            pass
+        return pdf_path
+
+    def put(self, key, src_path):
+        """
+        将转换生成的PDF移动到缓存中
+
+        Returns:
+            缓存中的预览文件路径
+        """
+        pdf_path = self.path_for(key)
+        os.replace(src_path, pdf_path)
+        size = os.path.getsize(pdf_path)
+        with self._lock:
+            self.total_bytes -= self.entries.pop(key, 0)
+            self.entries[key] = size
+            self.total_bytes += size
+            self._evict()
+        return pdf_path
+
+    def _evict(self):
+        """淘汰最久未使用的预览，直到总大小不超过上限（调用方持有锁或处于初始化阶段）"""
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            key, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            self._key_locks.pop(key, None)
+            try:
+                os.remove(self.path_for(key))
+                logger.info(f"淘汰预览缓存: {key}")
+            except OSError as e:
+                logger.warning(f"删除预览缓存失败: {e}")
+
+
+preview_cache = PreviewCache(app.config['PREVIEW_FOLDER'], app.config['PREVIEW_CACHE_MAX_BYTES'])
+
 def get_preview_file(original_filename):
     """
     获取预览文件路径
@@ -271,27 +1137,85 @@ def get_preview_file(original_filename):
     if original_filename.lower().endswith('.pdf'):
         return original_path
 
-    # 如果是文档，尝试转换为PDF
+    # 如果是文档，按内容哈希查找缓存，未命中时转换为PDF
     if is_document_file(original_filename):
-        name, ext = os.path.splitext(original_filename)
-        pdf_filename = f"{name}.pdf"
-
-        # 获取安全的PDF路径
-        pdf_path = get_safe_path(app.config['PREVIEW_FOLDER'], pdf_filename)
-        if not pdf_path:
-            return None
+        key = get_content_key(original_filename, original_path)
 
-        # 如果PDF已存在，直接返回
-        if os.path.exists(pdf_path):
-            return pdf_path
-
-        # 否则转换
-        converted_pdf = convert_to_pdf(original_path, app.config['PREVIEW_FOLDER'])
-        if converted_pdf:
-            return converted_pdf
+        with preview_cache.lock_for(key):
+            try:
+                pdf_path = preview_cache.get(key)
+                if pdf_path:
+                    return pdf_path
+
+                # 转换到临时目录后再移动到缓存，避免同名文件互相覆盖
+                with tempfile.TemporaryDirectory(dir=app.config['PREVIEW_FOLDER'], prefix='.convert-') as tmp_dir:
+                    converted_pdf = convert_to_pdf(original_path, tmp_dir)
+                    if converted_pdf:
+                        return preview_cache.put(key, converted_pdf)
+            finally:
+                # 转换失败时不保留该键的锁，避免锁表随转换失败的文件不断增长
+                preview_cache.discard_lock(key)
     
     return None
 
+def submit_task(fn, *args):
+    """向后台线程池提交短任务，并统计排队和执行中的任务数"""
+    def run():
+        with executor_tasks_lock:
+            executor_tasks['queued'] -= 1
+            executor_tasks['active'] += 1
+        try:
+            return fn(*args)
+        finally:
+            with executor_tasks_lock:
+                executor_tasks['active'] -= 1
+
+    with executor_tasks_lock:
+        executor_tasks['queued'] += 1
+    try:
+        return EXECUTOR.submit(run)
+    except RuntimeError:
+        with executor_tasks_lock:
+            executor_tasks['queued'] -= 1
+        raise
+
+def submit_conversion(fn, *args):
+    """
+    向线程池提交文档转换任务
+
+    转换名额已满时直接放弃（预览会在请求时按需转换），不在队列中堆积
+
+    Returns:
+        Future对象，未提交返回None
+    """
+    if not CONVERSION_SLOTS.acquire(blocking=False):
+        logger.info("转换任务已满，跳过后台预生成")
+        return None
+
+    def run():
+        global active_conversions
+        with active_conversions_lock:
+            active_conversions += 1
+        try:
+            return fn(*args)
+        finally:
+            with active_conversions_lock:
+                active_conversions -= 1
+            CONVERSION_SLOTS.release()
+
+    try:
+        return submit_task(run)
+    except RuntimeError:
+        CONVERSION_SLOTS.release()
+        raise
+
+def warm_preview_cache(filename):
+    """上传完成后在后台预先生成文档预览"""
+    try:
+        get_preview_file(filename)
+    except Exception as e:
+        logger.warning(f"预生成预览失败: {e}")
+
 def get_printers():
     """获取可用的CUPS打印机列表"""
     try:
@@ -320,15 +1244,17 @@ def get_printers():
                         elif 'is stopped' in line.lower():
                             status = 'stopped'
 
-                        # 获取打印机URI
-                        printer_uri = get_printer_uri(printer_name)
-
                         printers.append({
                             'name': printer_name,
                             'status': status,
-                            'uri': printer_uri
+                            'uri': None
                         })
 
+            # 一次查询获取所有打印机URI，并同时刷新URI缓存
+            device_uris = refresh_printer_uris() or {}
+            for printer in printers:
+                printer['uri'] = device_uris.get(printer['name'])
+
         if not printers:
             logger.warning("未检测到可用打印机")
 
@@ -342,26 +1268,29 @@ def cleanup_old_jobs():
     while True:
         time.sleep(3600)  # 每小时清理一次
         try:
-            with print_jobs_lock:
-                now = datetime.now()
-                old_jobs = [
-                    job_id for job_id, job in print_jobs.items()
-                    if (now - datetime.fromisoformat(job['timestamp'])).total_seconds() > 86400
-                ]
-                for job_id in old_jobs:
-                    # 删除关联文件
-                    filepath = os.path.join(app.config['UPLOAD_FOLDER'], print_jobs[job_id]['filename'])
-                    if os.path.exists(filepath):
-                        try:
-                            os.remove(filepath)
-                            print(f"清理旧文件: {print_jobs[job_id]['filename']}")
-                        except Exception as e:
-                            print(f"删除文件失败: {e}")
-                    # 删除任务记录
-                    del print_jobs[job_id]
-                    print(f"清理旧任务: {job_id}")
-                if old_jobs:
-                    print(f"共清理 {len(old_jobs)} 个旧任务记录")
+            now = datetime.now()
+            old_jobs = [
+                job for job in print_jobs.values()
+                if (now - datetime.fromisoformat(job['timestamp'])).total_seconds() > 86400
+            ]
+            for job in old_jobs:
+                # 删除关联文件
+                filepath = os.path.join(app.config['UPLOAD_FOLDER'], job['filename'])
+                if os.path.exists(filepath):
+                    try:
+                        os.remove(filepath)
+                        print(f"清理旧文件: {job['filename']}")
+                    except Exception as e:
+                        print(f"删除文件失败: {e}")
+                if not os.path.exists(filepath):
+                    # 文件已删除，同时移除它的内容哈希记录
+                    with upload_keys_lock:
+                        upload_keys.pop(job['filename'], None)
+                # 删除任务记录
+                print_jobs.delete(job['id'])
+                print(f"清理旧任务: {job['id']}")
+            if old_jobs:
+                print(f"共清理 {len(old_jobs)} 个旧任务记录")
         except Exception as e:
             print(f"清理任务失败: {e}")
 
@@ -369,9 +1298,9 @@ def cleanup_old_jobs():
 cleanup_thread = threading.Thread(target=cleanup_old_jobs, daemon=True)
 cleanup_thread.start()
 
-def submit_print_job(filepath, printer_name, color_mode='mono', duplex='one-sided', orientation='portrait', paper_size='A4', paper_type='plain', copies=1, page_range=None):
+def enqueue_print_job(filepath, printer_name, color_mode='mono', duplex='one-sided', orientation='portrait', paper_size='A4', paper_type='plain', copies=1, page_range=None, priority=DEFAULT_JOB_PRIORITY):
     """
-    提交打印任务到CUPS
+    将打印任务加入优先级队列，由分发线程按优先级提交到CUPS
 
     Args:
         filepath: 文件路径
@@ -383,9 +1312,87 @@ def submit_print_job(filepath, printer_name, color_mode='mono', duplex='one-side
         paper_type: 纸张材质 (plain, glossy)
         copies: 打印份数
         page_range: 页面范围，格式如 "1-5,8,10-12"
+        priority: 优先级 0-9，数值越小越优先
+
+    Returns:
+        任务ID
     """
     job_id = str(uuid.uuid4())
 
+    print_jobs.create(job_id, {
+        'id': job_id,
+        'cups_job_id': None,
+        'filename': os.path.basename(filepath),
+        'filepath': filepath,
+        'printer': printer_name,
+        'color_mode': color_mode,
+        'duplex': duplex,
+        'orientation': orientation,
+        'paper_size': paper_size,
+        'paper_type': paper_type,
+        'copies': copies,
+        'page_range': page_range,
+        'priority': priority,
+        'status': 'queued',
+        'message': '任务已加入打印队列',
+        'timestamp': datetime.now().isoformat(),
+        'progress': 0
+    })
+
+    JOB_QUEUE.put((priority, time.time(), job_id))
+    # 每个入队任务对应一次分发，分发时取出的是队列中优先级最高的任务
+    PRINT_EXECUTOR.submit(dispatch_print_job)
+
+    return job_id
+
+def dispatch_print_job():
+    """从优先级队列中取出一个任务并提交到CUPS"""
+    try:
+        priority, enqueue_time, job_id = JOB_QUEUE.get_nowait()
+    except queue.Empty:
+        return
+
+    try:
+        # 认领任务：状态仍为排队中时才改为提交中，任务在排队期间被取消、清理
+        # 或已被其他工作进程认领时跳过，保证同一任务只提交一次
+        if not print_jobs.update_if(
+            job_id, ('queued',),
+            status='submitting', message='正在提交到CUPS', dispatched_at=time.time()
+        ):
+            return
+        job = print_jobs.get(job_id)
+        if not job:
+            return
+
+        logger.info(f"分发打印任务: {job_id} (优先级 {priority}，排队 {time.time() - enqueue_time:.1f} 秒)")
+        submit_print_job(
+            job_id, job['filepath'], job['printer'], job['color_mode'], job['duplex'],
+            job['orientation'], job['paper_size'], job['paper_type'], job['copies'], job['page_range']
+        )
+    except Exception as e:
+        logger.error(f"分发打印任务失败: {e}")
+    finally:
+        JOB_QUEUE.task_done()
+
+def submit_print_job(job_id, filepath, printer_name, color_mode='mono', duplex='one-sided', orientation='portrait', paper_size='A4', paper_type='plain', copies=1, page_range=None):
+    """
+    提交打印任务到CUPS，并更新任务状态
+
+    Args:
+        job_id: 任务ID
+        filepath: 文件路径
+        printer_name: 打印机名称
+        color_mode: color/mono
+        duplex: one-sided/two-sided-long-edge/two-sided-short-edge
+        orientation: portrait/landscape (打印方向)
+        paper_size: 纸张大小 (A4, A3, A2, A1, 5x7, 6x8, 7x10)
+        paper_type: 纸张材质 (plain, glossy)
+        copies: 打印份数
+        page_range: 页面范围，格式如 "1-5,8,10-12"
+
+    Returns:
+        bool: 提交成功返回True
+    """
     try:
         # 构建lp命令
         cmd = ['lp', '-d', printer_name, '-n', str(copies)]
@@ -477,50 +1484,66 @@ def submit_print_job(filepath, printer_name, color_mode='mono', duplex='one-side
                                 break
 
         # 更新任务状态
-        print_jobs[job_id] = {
-            'id': job_id,
-            'cups_job_id': cups_job_id,
-            'filename': os.path.basename(filepath),
-            'printer': printer_name,
-            'color_mode': color_mode,
-            'duplex': duplex,
-            'orientation': orientation,
-            'paper_size': paper_size,
-            'paper_type': paper_type,
-            'copies': copies,
-            'page_range': page_range,
-            'status': 'submitted' if result.returncode == 0 else 'failed',
-            'message': result.stdout if result.returncode == 0 else result.stderr,
-            'timestamp': datetime.now().isoformat(),
-            'progress': 0
-        }
+        print_jobs.update(
+            job_id,
+            cups_job_id=cups_job_id,
+            status='submitted' if result.returncode == 0 else 'failed',
+            message=result.stdout if result.returncode == 0 else result.stderr,
+            progress=0
+        )
         
         if result.returncode == 0:
-            # 启动后台线程监控进度
-            monitor_thread = threading.Thread(
-                target=monitor_job_progress,
-                args=(job_id, cups_job_id, printer_name)
-            )
-            monitor_thread.daemon = True
-            monitor_thread.start()
+            # 登记到监控线程跟踪进度
+            monitor_job_progress(job_id, cups_job_id, printer_name)
         
-        return job_id, result.returncode == 0
+        return result.returncode == 0
         
     except Exception as e:
-        print_jobs[job_id] = {
-            'id': job_id,
-            'filename': os.path.basename(filepath),
-            'printer': printer_name,
-            'status': 'error',
-            'message': str(e),
-            'timestamp': datetime.now().isoformat(),
-            'progress': 0
+        print_jobs.update(job_id, status='error', message=str(e), progress=0)
+        return False
+
+# 需要监控进度的任务状态，任务被取消或已标记结束后不再更新
+MONITORED_STATUSES = ('submitted', 'processing')
+
+def update_monitored_job(job_id, message=None, **fields):
+    """
+    更新监控中的任务，任务已被取消或已标记结束（可能由其他工作进程完成）时不做修改
+
+    Returns:
+        bool: 是否已更新，为False时应停止监控
+    """
+    if not print_jobs.update_if(job_id, MONITORED_STATUSES, **fields):
+        return False
+    if message:
+        print_jobs.append_message(job_id, message)
+    return True
+
+def monitor_job_progress(job_id, cups_job_id, printer_name, start_time=None):
+    """
+    登记打印任务进度监控
+
+    所有任务由同一个监控线程轮询（见 job_monitor_loop），不为每个任务占用一个线程
+
+    Args:
+        start_time: 任务提交时间，恢复重启前的任务时传入，默认为当前时间
+    """
+    # 如果没有获取到cups_job_id，直接标记为完成
+    if not cups_job_id:
+        update_monitored_job(job_id, ' (任务已提交，无法监控详细进度)', status='completed', progress=100)
+        return
+
+    with active_monitors_lock:
+        active_monitors[job_id] = {
+            # 构建CUPS任务标识符
+            'job_identifier': f"{printer_name}-{cups_job_id}",
+            'start_time': start_time or time.time(),
+            'next_check': 0
         }
-        return job_id, False
+    monitor_wakeup.set()
 
-def monitor_job_progress(job_id, cups_job_id, printer_name):
+def check_job_progress(job_id, job_identifier, start_time):
     """
-    监控打印任务进度
+    检查一次打印任务进度
     
     支持长时间打印任务，动态调整监控间隔：
     - 前10分钟：每2秒检查一次
@@ -528,145 +1551,205 @@ def monitor_job_progress(job_id, cups_job_id, printer_name):
     - 30-60分钟：每30秒检查一次
     - 60分钟以上：每60秒检查一次
     - 最大监控时间：2小时
+
+    Returns:
+        距下次检查的秒数，监控结束返回None
     """
-    # 如果没有获取到cups_job_id，直接标记为完成
-    if not cups_job_id:
-        print_jobs[job_id]['status'] = 'completed'
-        print_jobs[job_id]['progress'] = 100
-        print_jobs[job_id]['message'] += ' (任务已提交，无法监控详细进度)'
-        return
-    
-    # 构建CUPS任务标识符
-    job_identifier = f"{printer_name}-{cups_job_id}"
-    
-    # 记录开始时间
-    start_time = time.time()
     max_monitor_time = 2 * 60 * 60  # 最大监控时间：2小时（7200秒）
+
+    if job_id not in print_jobs:
+        return None
+
+    # 计算已运行时间
+    elapsed_time = time.time() - start_time
     
-    while job_id in print_jobs:
-        # 计算已运行时间
-        elapsed_time = time.time() - start_time
-        
-        # 检查是否超过最大监控时间
-        if elapsed_time >= max_monitor_time:
-            if print_jobs[job_id]['status'] == 'processing':
-                print_jobs[job_id]['status'] = 'completed'
-                print_jobs[job_id]['progress'] = 100
-                print_jobs[job_id]['message'] += f' (监控超时，已运行{int(elapsed_time/60)}分钟，任务可能已完成)'
-            break
+    # 检查是否超过最大监控时间
+    if elapsed_time >= max_monitor_time:
+        update_monitored_job(job_id, f' (监控超时，已运行{int(elapsed_time/60)}分钟，任务可能已完成)', status='completed', progress=100)
+        return None
+    
+    try:
+        # 使用lpstat检查特定任务的状态
+        # lpstat -o <job-id> 检查特定任务
+        result = subprocess.run(
+            ['lpstat', '-o', job_identifier],
+            capture_output=True,
+            text=True,
+            timeout=5
+        )
         
-        try:
-            # 使用lpstat检查特定任务的状态
-            # lpstat -o <job-id> 检查特定任务
-            result = subprocess.run(
-                ['lpstat', '-o', job_identifier],
+        if result.returncode == 0:
+            # 任务还在队列中
+            output = result.stdout.strip()
+            
+            # 根据已运行时间调整进度显示
+            progress = min(95, int((elapsed_time / 600) * 60))  # 前10分钟到60%
+            if elapsed_time > 600:
+                progress = min(95, 60 + int((elapsed_time - 600) / 1800) * 35)  # 10-40分钟到95%
+            
+            # 检查任务状态
+            if 'held' in output.lower():
+                # 任务被暂停
+                if not update_monitored_job(job_id, status='processing', progress=min(80, progress)):
+                    return None
+            elif 'processing' in output.lower() or 'is printing' in output.lower():
+                # 任务正在打印
+                if not update_monitored_job(job_id, status='processing', progress=min(95, max(60, progress))):
+                    return None
+            else:
+                # 任务在队列中等待
+                if not update_monitored_job(job_id, status='processing', progress=min(60, progress)):
+                    return None
+        else:
+            # 任务不在活动队列中，检查已完成队列
+            completed_result = subprocess.run(
+                ['lpstat', '-W', 'completed', '-o', job_identifier],
                 capture_output=True,
                 text=True,
                 timeout=5
             )
             
-            if result.returncode == 0:
-                # 任务还在队列中
-                output = result.stdout.strip()
-                
-                # 根据已运行时间调整进度显示
-                progress = min(95, int((elapsed_time / 600) * 60))  # 前10分钟到60%
-                if elapsed_time > 600:
-                    progress = min(95, 60 + int((elapsed_time - 600) / 1800) * 35)  # 10-40分钟到95%
-                
-                # 检查任务状态
-                if 'held' in output.lower():
-                    # 任务被暂停
-                    print_jobs[job_id]['status'] = 'processing'
-                    print_jobs[job_id]['progress'] = min(80, progress)
-                elif 'processing' in output.lower() or 'is printing' in output.lower():
-                    # 任务正在打印
-                    print_jobs[job_id]['status'] = 'processing'
-                    print_jobs[job_id]['progress'] = min(95, max(60, progress))
+            if completed_result.returncode == 0:
+                # 任务已完成
+                update_monitored_job(job_id, f' (打印完成，耗时{int(elapsed_time)}秒)', status='completed', progress=100)
+                return None
+            
+            # 检查未完成的任务（包括暂停、等待等状态）
+            not_completed_result = subprocess.run(
+                ['lpstat', '-W', 'not-completed', '-o', job_identifier],
+                capture_output=True,
+                text=True,
+                timeout=5
+            )
+            
+            if not_completed_result.returncode == 0:
+                # 任务还在未完成队列中，但不在活动队列
+                # 可能是暂停状态或等待状态
+                output = not_completed_result.stdout.strip()
+                if 'held' in output.lower() or 'paused' in output.lower():
+                    if not update_monitored_job(job_id, status='processing', progress=min(80, int((elapsed_time / 600) * 60))):
+                        return None
+                    print_jobs.append_message(job_id, ' (任务已暂停)')
                 else:
-                    # 任务在队列中等待
-                    print_jobs[job_id]['status'] = 'processing'
-                    print_jobs[job_id]['progress'] = min(60, progress)
+                    # 其他状态，继续监控
+                    if not update_monitored_job(job_id, status='processing', progress=min(80, int((elapsed_time / 600) * 60))):
+                        return None
             else:
-                # 任务不在活动队列中，检查已完成队列
-                completed_result = subprocess.run(
-                    ['lpstat', '-W', 'completed', '-o', job_identifier],
+                # 任务不在未完成队列中，检查所有队列
+                all_result = subprocess.run(
+                    ['lpstat', '-W', 'all', '-o', job_identifier],
                     capture_output=True,
                     text=True,
                     timeout=5
                 )
                 
-                if completed_result.returncode == 0:
-                    # 任务已完成
-                    print_jobs[job_id]['status'] = 'completed'
-                    print_jobs[job_id]['progress'] = 100
-                    print_jobs[job_id]['message'] += f' (打印完成，耗时{int(elapsed_time)}秒)'
-                    break
-                
-                # 检查未完成的任务（包括暂停、等待等状态）
-                not_completed_result = subprocess.run(
-                    ['lpstat', '-W', 'not-completed', '-o', job_identifier],
-                    capture_output=True,
-                    text=True,
-                    timeout=5
-                )
-                
-                if not_completed_result.returncode == 0:
-                    # 任务还在未完成队列中，但不在活动队列
-                    # 可能是暂停状态或等待状态
-                    output = not_completed_result.stdout.strip()
-                    if 'held' in output.lower() or 'paused' in output.lower():
-                        print_jobs[job_id]['status'] = 'processing'
-                        print_jobs[job_id]['message'] += ' (任务已暂停)'
-                        print_jobs[job_id]['progress'] = min(80, int((elapsed_time / 600) * 60))
+                if all_result.returncode == 0:
+                    # 任务在历史记录中，但不在活动和已完成队列
+                    output = all_result.stdout.strip()
+                    if 'aborted' in output.lower() or 'canceled' in output.lower() or 'cancelled' in output.lower():
+                        update_monitored_job(job_id, ' (任务已取消)', status='cancelled')
+                        return None
                     else:
-                        # 其他状态，继续监控
-                        print_jobs[job_id]['status'] = 'processing'
-                        print_jobs[job_id]['progress'] = min(80, int((elapsed_time / 600) * 60))
+                        # 其他未知状态，可能是失败或异常
+                        update_monitored_job(job_id, ' (任务状态未知，已停止监控)', status='completed', progress=100)
+                        return None
                 else:
-                    # 任务不在未完成队列中，检查所有队列
-                    all_result = subprocess.run(
-                        ['lpstat', '-W', 'all', '-o', job_identifier],
-                        capture_output=True,
-                        text=True,
-                        timeout=5
-                    )
-                    
-                    if all_result.returncode == 0:
-                        # 任务在历史记录中，但不在活动和已完成队列
-                        output = all_result.stdout.strip()
-                        if 'aborted' in output.lower() or 'canceled' in output.lower() or 'cancelled' in output.lower():
-                            print_jobs[job_id]['status'] = 'cancelled'
-                            print_jobs[job_id]['message'] += ' (任务已取消)'
-                            break
-                        else:
-                            # 其他未知状态，可能是失败或异常
-                            print_jobs[job_id]['status'] = 'completed'
-                            print_jobs[job_id]['progress'] = 100
-                            print_jobs[job_id]['message'] += ' (任务状态未知，已停止监控)'
-                            break
-                    else:
-                        # 任务完全不存在于任何队列
-                        # 可能是任务创建失败或已被系统清理
-                        print_jobs[job_id]['status'] = 'completed'
-                        print_jobs[job_id]['progress'] = 100
-                        print_jobs[job_id]['message'] += ' (任务已完成或被系统清理)'
-                        break
-            
-            # 动态调整监控间隔
-            if elapsed_time < 600:  # 前10分钟：每2秒检查一次
-                time.sleep(2)
-            elif elapsed_time < 1800:  # 10-30分钟：每10秒检查一次
-                time.sleep(10)
-            elif elapsed_time < 3600:  # 30-60分钟：每30秒检查一次
-                time.sleep(30)
-            else:  # 60分钟以上：每60秒检查一次
-                time.sleep(60)
-            
-        except Exception as e:
-            print(f"监控任务进度失败: {e}")
-            # 出错时等待较长时间再重试
-            time.sleep(10)
+                    # 任务完全不存在于任何队列
+                    # 可能是任务创建失败或已被系统清理
+                    update_monitored_job(job_id, ' (任务已完成或被系统清理)', status='completed', progress=100)
+                    return None
+        
+        # 动态调整监控间隔
+        if elapsed_time < 600:  # 前10分钟：每2秒检查一次
+            return 2
+        elif elapsed_time < 1800:  # 10-30分钟：每10秒检查一次
+            return 10
+        elif elapsed_time < 3600:  # 30-60分钟：每30秒检查一次
+            return 30
+        else:  # 60分钟以上：每60秒检查一次
+            return 60
+        
+    except Exception as e:
+        print(f"监控任务进度失败: {e}")
+        # 出错时等待较长时间再重试
+        return 10
+
+def job_monitor_loop():
+    """监控线程：轮询所有已登记的打印任务，按各自的间隔检查进度"""
+    while True:
+        monitor_wakeup.clear()
+
+        now = time.time()
+        with active_monitors_lock:
+            due = [
+                (job_id, monitor) for job_id, monitor in active_monitors.items()
+                if monitor['next_check'] <= now
+            ]
+
+        for job_id, monitor in due:
+            interval = check_job_progress(job_id, monitor['job_identifier'], monitor['start_time'])
+            with active_monitors_lock:
+                if interval is None:
+                    active_monitors.pop(job_id, None)
+                else:
+                    monitor['next_check'] = time.time() + interval
+
+        with active_monitors_lock:
+            next_check = min((m['next_check'] for m in active_monitors.values()), default=None)
+
+        # 没有任务时一直等待，直到有新任务登记
+        timeout = None if next_check is None else max(0, next_check - time.time())
+        monitor_wakeup.wait(timeout)
+
+# 在启动时启动打印任务监控线程
+monitor_thread = threading.Thread(target=job_monitor_loop, daemon=True)
+monitor_thread.start()
+
+# 提交中的任务超过该时间（lp超时的两倍）仍未更新状态，说明提交它的进程已退出
+SUBMIT_STALE_SECONDS = 60
+
+def recover_print_jobs():
+    """
+    恢复任务存储中未结束的任务（使用Redis保存任务时，服务重启后任务记录仍然存在）
+
+    - 排队中的任务重新加入本进程的优先级队列，分发时通过状态比较更新认领，
+      多个工作进程同时恢复也只会由一个进程提交
+    - 已提交到CUPS的任务重新登记进度监控
+    - 提交过程中进程退出的任务无法确认是否已打印，标记为失败
+    """
+    try:
+        submitting_jobs = []
+        for job in print_jobs.values():
+            status = job.get('status')
+            if status == 'queued':
+                enqueue_time = datetime.fromisoformat(job['timestamp']).timestamp()
+                JOB_QUEUE.put((job.get('priority', DEFAULT_JOB_PRIORITY), enqueue_time, job['id']))
+                PRINT_EXECUTOR.submit(dispatch_print_job)
+            elif status in MONITORED_STATUSES:
+                monitor_job_progress(job['id'], job.get('cups_job_id'), job['printer'], job.get('dispatched_at'))
+            elif status == 'submitting':
+                submitting_jobs.append(job)
+
+        if submitting_jobs:
+            logger.info(f"恢复 {len(submitting_jobs)} 个提交中的打印任务")
+
+        # 其他工作进程可能正在提交这些任务，等到超时后仍未更新状态再标记失败
+        for job in sorted(submitting_jobs, key=lambda job: job.get('dispatched_at') or 0):
+            wait = (job.get('dispatched_at') or 0) + SUBMIT_STALE_SECONDS - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            print_jobs.update_if(
+                job['id'], ('submitting',),
+                status='failed',
+                message='服务重启时任务正在提交到CUPS，无法确认是否已打印，请检查打印机队列后重新提交',
+                progress=0
+            )
+    except Exception as e:
+        logger.error(f"恢复打印任务失败: {e}")
+
+# 在启动时恢复重启前未结束的打印任务
+recovery_thread = threading.Thread(target=recover_print_jobs, daemon=True)
+recovery_thread.start()
 
 
 def get_print_queue():
@@ -769,6 +1852,13 @@ def api_printers():
     printers = get_printers()
     return jsonify({'printers': printers})
 
+def make_upload_filename(original_filename):
+    """生成上传文件的保存文件名（添加时间戳避免文件名冲突）"""
+    filename = secure_filename(original_filename)
+    name, ext = os.path.splitext(filename)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return f"{name}_{timestamp}{ext}"
+
 @app.route('/api/upload', methods=['POST'])
 def api_upload():
     """上传文件"""
@@ -781,26 +1871,93 @@ def api_upload():
     
     if file and allowed_file(file.filename):
         try:
-            # 获取文件名和扩展名
-            filename = secure_filename(file.filename)
-            name, ext = os.path.splitext(filename)
-            
-            # 添加时间戳避免文件名冲突
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"{name}_{timestamp}{ext}"
-            
+            filename = make_upload_filename(file.filename)
             filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
+            # 默认16KB缓冲区系统调用过多，使用1MB缓冲区复制
+            file.save(filepath, buffer_size=app.config['UPLOAD_CHUNK_SIZE'])
+
+            # 记录内容哈希，需要转换的文档在后台预生成预览
+            content_key = compute_content_key(filepath)
+            with upload_keys_lock:
+                upload_keys[filename] = content_key
+            if is_document_file(filename):
+                submit_conversion(warm_preview_cache, filename)
+
             return jsonify({
                 'success': True,
                 'filename': filename,
-                'filepath': filepath
+                'filepath': filepath,
+                'content_key': content_key
             })
         except Exception as e:
             return jsonify({'error': f'文件保存失败: {str(e)}'}), 500
     
     return jsonify({'error': '不支持的文件类型'}), 400
 
+@app.route('/api/upload_stream', methods=['PUT'])
+def api_upload_stream():
+    """
+    流式上传文件
+
+    请求体为文件原始内容（application/octet-stream），文件名经URL编码后放在X-Filename头中。
+    按块直接写入上传目录，不经过multipart解析和临时文件，内存占用与文件大小无关。
+    """
+    original_filename = unquote(request.headers.get('X-Filename', ''))
+    if not original_filename:
+        return jsonify({'error': '未选择文件'}), 400
+
+    if not allowed_file(original_filename):
+        return jsonify({'error': '不支持的文件类型'}), 400
+
+    max_length = app.config['MAX_CONTENT_LENGTH']
+    if request.content_length and request.content_length > max_length:
+        return jsonify({'error': '文件过大'}), 413
+
+    filename = make_upload_filename(original_filename)
+    filepath = get_safe_path(app.config['UPLOAD_FOLDER'], filename)
+    if not filepath:
+        return jsonify({'error': '非法文件路径'}), 403
+
+    chunk_size = app.config['UPLOAD_CHUNK_SIZE']
+    digest = hashlib.blake2b(digest_size=16)
+    received = 0
+
+    try:
+        with open(filepath, 'wb') as dest:
+            while True:
+                chunk = request.stream.read(chunk_size)
+                if not chunk:
+                    break
+                received += len(chunk)
+                if received > max_length:
+                    raise ValueError('文件过大')
+                dest.write(chunk)
+                # 边写入边计算内容哈希，无需再次读取文件
+                digest.update(chunk)
+    except Exception as e:
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        logger.error(f"流式上传失败: {e}")
+        return jsonify({'error': f'文件保存失败: {str(e)}'}), 500
+
+    if received == 0:
+        os.remove(filepath)
+        return jsonify({'error': '文件内容为空'}), 400
+
+    content_key = digest.hexdigest()
+    with upload_keys_lock:
+        upload_keys[filename] = content_key
+    # 图片和PDF无需转换，只为文档预生成预览
+    if is_document_file(filename):
+        submit_conversion(warm_preview_cache, filename)
+
+    return jsonify({
+        'success': True,
+        'filename': filename,
+        'filepath': filepath,
+        'content_key': content_key
+    })
+
 @app.route('/api/preview/<path:filename>', methods=['GET'])
 def api_preview(filename):
     """获取文件预览"""
@@ -809,10 +1966,7 @@ def api_preview(filename):
         
         if not preview_file:
             # 无法获取预览文件
-            ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
-            document_extensions = ['doc', 'docx', 'ppt', 'pptx', 'xls', 'xlsx', 'rtf', 'txt']
-            
-            if ext in document_extensions:
+            if is_document_file(filename):
                 # 文档文件需要LibreOffice转换
                 return jsonify({
                     'error': '文档转换失败',
@@ -826,6 +1980,13 @@ def api_preview(filename):
             # 获取文件所在的目录
             preview_dir = os.path.dirname(preview_file)
             preview_filename = os.path.basename(preview_file)
+
+            # 以上传文件的内容哈希作为ETag，内容不变时浏览器可直接使用缓存
+            upload_filename = os.path.basename(filename)
+            content_key = get_content_key(
+                upload_filename,
+                get_safe_path(app.config['UPLOAD_FOLDER'], upload_filename)
+            )
             
             # 根据文件类型设置Content-Type
             if preview_file.lower().endswith('.pdf'):
@@ -833,14 +1994,14 @@ def api_preview(filename):
                 response = send_from_directory(
                     preview_dir, 
                     preview_filename, 
-                    mimetype='application/pdf'
+                    mimetype='application/pdf',
+                    etag=content_key
                 )
                 # 强制设置Content-Disposition为inline，移除filename参数
                 response.headers['Content-Disposition'] = 'inline'
-                return response
             else:
                 # 图片文件
-                ext = preview_file.rsplit('.', 1)[1].lower()
+                ext = _ext(preview_file)
                 mime_types = {
                     'jpg': 'image/jpeg',
                     'jpeg': 'image/jpeg',
@@ -849,11 +2010,20 @@ def api_preview(filename):
                     'bmp': 'image/bmp',
                     'svg': 'image/svg+xml'
                 }
-                return send_from_directory(
+                response = send_from_directory(
                     preview_dir, 
                     preview_filename, 
-                    mimetype=mime_types.get(ext, 'application/octet-stream')
+                    mimetype=mime_types.get(ext, 'application/octet-stream'),
+                    etag=content_key
                 )
+
+            if request.args.get('v') == content_key:
+                # URL中带有内容哈希时内容永远不会变化，可长期缓存
+                response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+            else:
+                # 同一文件名可能对应不同内容，每次通过ETag确认（未变化时返回304）
+                response.headers['Cache-Control'] = 'no-cache'
+            return response
         else:
             return jsonify({'error': '预览文件不存在'}), 404
     except Exception as e:
@@ -904,19 +2074,10 @@ def api_delete_file(filename):
             # 删除原始文件
             os.remove(filepath)
             
-            # 同时删除对应的预览文件（如果存在）
-            # 对于文档文件，预览文件会保存在PREVIEW_FOLDER
-            name, ext = os.path.splitext(filename)
-            if is_document_file(filename) and not ext.lower().endswith('.pdf'):
-                # 文档文件的预览是转换后的PDF
-                preview_pdf = get_safe_path(app.config['PREVIEW_FOLDER'], f"{name}.pdf")
-                if preview_pdf and os.path.exists(preview_pdf):
-                    try:
-                        os.remove(preview_pdf)
-                        logger.info(f"已删除预览文件: {preview_pdf}")
-                    except Exception as e:
-                        logger.warning(f"删除预览文件失败: {e}")
-                        # 不影响主流程，继续
+            # 预览文件按内容哈希缓存，可能被相同内容的其他文件共用，
+            # 这里只移除哈希记录，预览由LRU缓存自行淘汰
+            with upload_keys_lock:
+                upload_keys.pop(os.path.basename(filepath), None)
             
             return jsonify({'success': True})
         except Exception as e:
@@ -927,10 +2088,8 @@ def api_delete_file(filename):
 
 def validate_page_range(page_range):
     """验证页面范围格式"""
-    import re
     # 允许的格式: "1", "1-5", "1-5,8", "1-5,8,10-12"
-    pattern = r'^(\d+(-\d+)?)(,\s*\d+(-\d+)?)*$'
-    return bool(re.match(pattern, page_range))
+    return bool(_PAGE_RANGE_RE.match(page_range))
 
 @app.route('/api/print', methods=['POST'])
 def api_print():
@@ -957,6 +2116,7 @@ def api_print():
     paper_type = data.get('paper_type', 'plain')
     copies = data.get('copies', '1')
     page_range = data.get('page_range', None)
+    priority = data.get('priority', DEFAULT_JOB_PRIORITY)
 
     # 记录解析后的参数
     logger.info(f"解析后的参数:")
@@ -969,6 +2129,7 @@ def api_print():
     logger.info(f"  paper_type: {paper_type}")
     logger.info(f"  copies: {copies}")
     logger.info(f"  page_range: {page_range}")
+    logger.info(f"  priority: {priority}")
 
     # 基本参数验证
     if not filepath or not printer_name:
@@ -1013,25 +2174,28 @@ def api_print():
             return jsonify({'error': '页面范围格式无效，示例: 1-5,8,10-12'}), 400
         page_range = page_range.strip()
 
-    job_id, success = submit_print_job(filepath, printer_name, color_mode, duplex, orientation, paper_size, paper_type, copies, page_range)
+    # 验证优先级（0 最高，9 最低）
+    try:
+        priority = int(priority)
+        if priority < 0 or priority > 9:
+            return jsonify({'error': '优先级必须在0-9之间'}), 400
+    except (ValueError, TypeError):
+        return jsonify({'error': '优先级必须是数字'}), 400
+
+    job_id = enqueue_print_job(filepath, printer_name, color_mode, duplex, orientation, paper_size, paper_type, copies, page_range, priority)
     
-    if success:
-        return jsonify({
-            'success': True,
-            'job_id': job_id,
-            'job': print_jobs[job_id]
-        })
-    else:
-        return jsonify({
-            'success': False,
-            'error': print_jobs[job_id]['message']
-        }), 500
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'job': print_jobs.get(job_id)
+    })
 
 @app.route('/api/jobs/<job_id>', methods=['GET'])
 def api_job_status(job_id):
     """获取任务状态"""
-    if job_id in print_jobs:
-        return jsonify({'job': print_jobs[job_id]})
+    job = print_jobs.get(job_id)
+    if job:
+        return jsonify({'job': job})
     return jsonify({'error': '任务不存在'}), 404
 
 @app.route('/api/jobs', methods=['GET'])
@@ -1042,14 +2206,18 @@ def api_all_jobs():
 @app.route('/api/jobs/<job_id>', methods=['DELETE'])
 def api_cancel_job(job_id):
     """取消打印任务"""
-    if job_id not in print_jobs:
+    job = print_jobs.get(job_id)
+    if not job:
         return jsonify({'error': '任务不存在'}), 404
     
-    job = print_jobs[job_id]
     
     # 检查任务是否已经完成
     if job['status'] in ['completed', 'failed', 'error']:
         return jsonify({'error': '任务已经结束，无法取消'}), 400
+
+    # 提交中的任务还没有CUPS任务号，等待提交完成后再取消
+    if job['status'] == 'submitting':
+        return jsonify({'error': '任务正在提交到打印机，请稍后再试'}), 409
     
     # 尝试取消CUPS任务
     if job['cups_job_id']:
@@ -1062,7 +2230,7 @@ def api_cancel_job(job_id):
             )
             
             if result.returncode == 0:
-                print_jobs[job_id]['status'] = 'cancelled'
+                print_jobs.update(job_id, status='cancelled')
                 return jsonify({
                     'success': True,
                     'message': '打印任务已取消'
@@ -1078,8 +2246,9 @@ def api_cancel_job(job_id):
                 'error': str(e)
             }), 500
     else:
-        # 如果没有cups_job_id，标记为取消
-        print_jobs[job_id]['status'] = 'cancelled'
+        # 如果没有cups_job_id，标记为取消（期间已被分发线程认领时不修改）
+        if not print_jobs.update_if(job_id, ('queued',) + MONITORED_STATUSES, status='cancelled'):
+            return jsonify({'error': '任务正在提交到打印机，请稍后再试'}), 409
         return jsonify({
             'success': True,
             'message': '任务已标记为取消'
@@ -1091,6 +2260,30 @@ def api_queue():
     queue = get_print_queue()
     return jsonify({'queue': queue})
 
+@app.route('/api/status', methods=['GET'])
+def api_status():
+    """获取服务状态（后台任务队列积压情况）"""
+    with active_conversions_lock:
+        conversions = active_conversions
+    with executor_tasks_lock:
+        tasks = dict(executor_tasks)
+    with active_monitors_lock:
+        monitors = len(active_monitors)
+    return jsonify({
+        'executor': {
+            'max_workers': EXECUTOR_MAX_WORKERS,
+            'active': tasks['active'],
+            'queue_depth': tasks['queued']
+        },
+        'monitored_jobs': monitors,
+        'conversions': {
+            'active': conversions
+        },
+        'libreoffice_service': libreoffice_service.is_running(),
+        'jobs': len(print_jobs),
+        'print_queue_depth': JOB_QUEUE.qsize()
+    })
+
 @app.route('/api/printer-queue/<printer_name>', methods=['GET'])
 def api_printer_queue(printer_name):
     """获取特定打印机的队列信息"""
@@ -1112,23 +2305,8 @@ def api_printer_tray_info(printer_name):
         printer_uri = None
 
         try:
-            result = subprocess.run(
-                ['lpstat', '-p', printer_name, '-v'],
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
-
-            # 先查找与当前打印机名称匹配的device行
-            import re
-            matched_device_uri = None
-
-            for line in result.stdout.split('\n'):
-                # 匹配: device for PrinterName: URI
-                match = re.search(r'device\s+for\s+' + re.escape(printer_name) + r':\s*(\S+)', line)
-                if match:
-                    matched_device_uri = match.group(1).strip()
-                    break
+            # 获取与当前打印机名称匹配的device URI（带缓存）
+            matched_device_uri = get_printer_uri(printer_name)
 
             if matched_device_uri:
                 # 根据匹配到的URI判断打印机类型
@@ -1157,7 +2335,6 @@ def api_printer_tray_info(printer_name):
             # IPP网络打印机，尝试通过ipptool获取真实纸盒信息
             logger.info(f"尝试通过ipptool获取打印机 {printer_name} 的纸盒信息: {printer_uri}")
             try:
-                from ipp_client import get_tray_info_via_ipptool
                 trays = get_tray_info_via_ipptool(printer_uri)
                 if trays:
                     tray_info['trays'].extend(trays)
@@ -1170,7 +2347,6 @@ def api_printer_tray_info(printer_name):
                     tray_info['details'] = '打印机可能不支持纸盒信息查询，或IPP端点不正确'
             except Exception as e:
                 logger.error(f"通过ipptool获取纸盒信息失败: {e}")
-                import traceback
                 traceback.print_exc()
                 tray_info['source'] = 'ipptool（查询失败）'
                 tray_info['error'] = str(e)
@@ -1221,23 +2397,8 @@ def api_printer_ink_info(printer_name):
         printer_uri = None
 
         try:
-            result = subprocess.run(
-                ['lpstat', '-p', printer_name, '-v'],
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
-
-            # 先查找与当前打印机名称匹配的device行
-            import re
-            matched_device_uri = None
-
-            for line in result.stdout.split('\n'):
-                # 匹配: device for PrinterName: URI
-                match = re.search(r'device\s+for\s+' + re.escape(printer_name) + r':\s*(\S+)', line)
-                if match:
-                    matched_device_uri = match.group(1).strip()
-                    break
+            # 获取与当前打印机名称匹配的device URI（带缓存）
+            matched_device_uri = get_printer_uri(printer_name)
 
             if matched_device_uri:
                 # 根据匹配到的URI判断打印机类型
@@ -1284,7 +2445,6 @@ def api_printer_ink_info(printer_name):
             # IPP网络打印机，尝试通过ipptool获取真实墨盒信息
             logger.info(f"尝试通过ipptool获取打印机 {printer_name} 的墨盒信息: {printer_uri}")
             try:
-                from ipp_client import get_ink_info_via_ipptool
                 cartridges = get_ink_info_via_ipptool(printer_uri)
                 if cartridges:
                     ink_info['cartridges'].extend(cartridges)
@@ -1297,7 +2457,6 @@ def api_printer_ink_info(printer_name):
                     ink_info['details'] = '打印机可能不支持墨盒信息查询，或IPP端点不正确'
             except Exception as e:
                 logger.error(f"通过ipptool获取墨盒信息失败: {e}")
-                import traceback
                 traceback.print_exc()
                 ink_info['source'] = 'ipptool（查询失败）'
                 ink_info['error'] = str(e)
@@ -1347,6 +2506,16 @@ def api_printer_ink_info(printer_name):
         logger.error(f"获取墨盒信息失败: {e}")
         return jsonify({'error': f'获取墨盒信息失败: {str(e)}'}), 500
 
+@app.route('/api/printer/<printer_name>/refresh', methods=['POST'])
+def api_printer_refresh(printer_name):
+    """清除打印机缓存信息并重新查询URI"""
+    invalidate_printer_uri(printer_name)
+    return jsonify({
+        'success': True,
+        'printer': printer_name,
+        'uri': get_printer_uri(printer_name)
+    })
+
 @app.route('/api/printer-diagnose/<printer_name>', methods=['GET'])
 def api_printer_diagnose(printer_name):
     """诊断打印机信息（调试用）"""
@@ -1367,27 +2536,19 @@ def api_printer_diagnose(printer_name):
         diagnose_info['lpstat_output'] = result.stdout
 
         # 2. 提取URI
-        import re
-        printer_uri = None
+        device_uris = parse_device_uris(result.stdout)
+        printer_uri = device_uris.get(printer_name)
         is_ipp_printer = False
 
-        for line in result.stdout.split('\n'):
-            match = re.search(r'device\s+for\s+' + re.escape(printer_name) + r':\s*(\S+)', line)
-            if match:
-                printer_uri = match.group(1).strip()
-                diagnose_info['matched_uri'] = printer_uri
-                diagnose_info['uri_type'] = 'matched'
-                break
+        if printer_uri:
+            diagnose_info['matched_uri'] = printer_uri
+            diagnose_info['uri_type'] = 'matched'
 
         if not printer_uri and 'ipp:' in result.stdout:
             diagnose_info['uri_type'] = 'fallback'
-            for line in result.stdout.split('\n'):
-                if 'device for' in line:
-                    match = re.search(r'device\s+for\s+\S+:\s*(\S+)', line)
-                    if match:
-                        printer_uri = match.group(1).strip()
-                        diagnose_info['fallback_uri'] = printer_uri
-                        break
+            if device_uris:
+                printer_uri = next(iter(device_uris.values()))
+                diagnose_info['fallback_uri'] = printer_uri
 
         diagnose_info['printer_uri'] = printer_uri
 
@@ -1403,12 +2564,12 @@ def api_printer_diagnose(printer_name):
                 diagnose_info['note'] = f'未知URI类型: {printer_uri[:20]}...'
 
         # 4. 检查IPP客户端
-        diagnose_info['ipp_available'] = IPP_AVAILABLE
+        diagnose_info['ipp_available'] = IPPTOOL_AVAILABLE
 
         # 5. 尝试IPP请求
-        if is_ipp_printer and printer_uri and IPP_AVAILABLE:
+        if is_ipp_printer and printer_uri and IPPTOOL_AVAILABLE:
             try:
-                cartridges = get_ink_info_via_ipp(printer_uri, timeout=5)
+                cartridges = get_ink_info_via_ipptool(printer_uri)
                 if cartridges:
                     diagnose_info['ipp_test'] = 'success'
                     diagnose_info['ipp_cartridges'] = cartridges
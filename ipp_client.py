@@ -4,28 +4,109 @@
 使用 ipptool 命令行工具提取信息
 """
 
+import os
+import itertools
+import shutil
 import subprocess
 import logging
 import re
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
+# printer-input-tray 状态码 -> 中文状态
+_TRAY_STATUS_MAP = {
+    '3': '空',
+    '4': '已装载',
+    '5': '可用',
+    '6': '移除'
+}
+
+# ipptool -v 输出中的属性行，如 "marker-levels (1setOf integer) = 90,80"
+_ATTRIBUTE_RE = re.compile(r'^\s*([\w-]+)\s*\([^)]+\)\s*=\s*(.+)$', re.MULTILINE)
+
 # 检查 ipptool 是否可用
 def check_ipptool_available():
     """检查 ipptool 命令是否可用"""
-    try:
-        result = subprocess.run(
-            ['which', 'ipptool'],
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
-        return result.returncode == 0
-    except:
-        return False
+    return shutil.which('ipptool') is not None
 
 IPPTOOL_AVAILABLE = check_ipptool_available()
 
+# Get-Printer-Attributes 测试文件，只请求墨盒和纸盒相关属性
+# （ipptool 自带的 get-printer-attributes.test 会让打印机返回全部属性）
+GET_PRINTER_ATTRIBUTES_TEST = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'ipptool', 'get-supply-attributes.test'
+)
+
+# ipptool 命令模板，调用时只需插入打印机URL
+_IPPTOOL_CMD_PREFIX = ('ipptool', '-tv')
+_IPPTOOL_CMD_SUFFIX = (GET_PRINTER_ATTRIBUTES_TEST,)
+
+# Get-Printer-Attributes 结果缓存有效期（秒）
+# 页面同时轮询墨盒和纸盒信息，短时间内复用同一次请求结果
+ATTRIBUTES_CACHE_TTL = 5
+
+# 打印机URL -> (属性, 缓存时间)
+_attributes_cache = {}
+# 打印机URL -> 锁，同一打印机同时只发出一个请求
+_attributes_locks = {}
+_attributes_lock = threading.Lock()
+
+def get_printer_attributes(printer_url):
+    """
+    获取打印机属性（带缓存，有效期 ATTRIBUTES_CACHE_TTL 秒）
+
+    墨盒和纸盒信息都来自同一个请求，统一在这里获取和解析
+
+    Args:
+        printer_url: 打印机URL，如 "ipp://192.168.1.100:631/ipp/print"
+
+    Returns:
+        {属性名称: 属性值文本}，失败返回None
+    """
+    with _attributes_lock:
+        url_lock = _attributes_locks.setdefault(printer_url, threading.Lock())
+
+    with url_lock:
+        cached = _attributes_cache.get(printer_url)
+        if cached and time.time() - cached[1] < ATTRIBUTES_CACHE_TTL:
+            return cached[0]
+
+        attributes = _request_printer_attributes(printer_url)
+        # 只缓存成功的结果
+        if attributes is not None:
+            _attributes_cache[printer_url] = (attributes, time.time())
+        return attributes
+
+def _request_printer_attributes(printer_url):
+    """
+    使用 ipptool 执行 Get-Printer-Attributes 请求（不使用缓存）
+
+    Args:
+        printer_url: 打印机URL
+
+    Returns:
+        {属性名称: 属性值文本}，失败返回None
+    """
+    cmd = [*_IPPTOOL_CMD_PREFIX, printer_url, *_IPPTOOL_CMD_SUFFIX]
+
+    logger.debug(f"执行命令: {' '.join(cmd)}")
+
+    result = subprocess.run(
+        cmd,
+        capture_output=True,
+        text=True,
+        timeout=30
+    )
+
+    if result.returncode != 0:
+        logger.error(f"ipptool 执行失败: {result.stderr}")
+        return None
+
+    # 解析输出
+    return _parse_ipp_attributes(result.stdout)
+
 def get_ink_info_via_ipptool(printer_url):
     """
     使用 ipptool 获取墨盒信息
@@ -50,50 +131,33 @@ def get_ink_info_via_ipptool(printer_url):
         return []
 
     try:
-        # 使用 ipptool 获取打印机属性
-        test_file = '/usr/share/cups/ipptool/get-printer-attributes.test'
-        cmd = ['ipptool', '-tv', printer_url, test_file]
-
-        logger.debug(f"执行命令: {' '.join(cmd)}")
-
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-
-        if result.returncode != 0:
-            logger.error(f"ipptool 执行失败: {result.stderr}")
+        # 获取打印机属性
+        attributes = get_printer_attributes(printer_url)
+        if attributes is None:
             return []
 
-        # 解析输出
-        output = result.stdout
-
         # 提取墨盒信息
-        marker_names = _parse_ipp_attribute(output, 'marker-names')
-        marker_colors = _parse_ipp_attribute(output, 'marker-colors')
-        marker_types = _parse_ipp_attribute(output, 'marker-types')
-        marker_levels = _parse_ipp_attribute(output, 'marker-levels')
-
-        # 构建墨盒信息列表
-        ink_cartridges = []
-        for i in range(len(marker_names)):
-            name = marker_names[i] if i < len(marker_names) else f'墨盒 {i+1}'
-            color = marker_colors[i] if i < len(marker_colors) else 'unknown'
-            level_type = marker_types[i] if i < len(marker_types) else 'unknown'
-            level = marker_levels[i] if i < len(marker_levels) else 0
-
-            # 过滤废墨盒
-            if level_type == 'waste-ink':
-                continue
-
-            ink_cartridges.append({
+        marker_names = _parse_ipp_attribute(attributes, 'marker-names')
+        marker_colors = _parse_ipp_attribute(attributes, 'marker-colors')
+        marker_types = _parse_ipp_attribute(attributes, 'marker-types')
+        marker_levels = _parse_ipp_attribute(attributes, 'marker-levels')
+
+        # 构建墨盒信息列表（以 marker-names 的数量为准，缺失的属性使用默认值）
+        rows = itertools.islice(
+            itertools.zip_longest(marker_names, marker_colors, marker_types, marker_levels),
+            len(marker_names)
+        )
+        ink_cartridges = [
+            {
                 'name': name,
-                'color': color,
-                'type': level_type,
-                'level': level
-            })
+                'color': 'unknown' if color is None else color,
+                'type': 'unknown' if level_type is None else level_type,
+                'level': 0 if level is None else level
+            }
+            for name, color, level_type, level in rows
+            # 过滤废墨盒
+            if level_type != 'waste-ink'
+        ]
 
         logger.debug(f"提取到 {len(ink_cartridges)} 个墨盒信息")
         return ink_cartridges
@@ -127,35 +191,20 @@ def get_tray_info_via_ipptool(printer_url):
         return []
 
     try:
-        # 使用 ipptool 获取打印机属性
-        test_file = '/usr/share/cups/ipptool/get-printer-attributes.test'
-        cmd = ['ipptool', '-tv', printer_url, test_file]
-
-        logger.debug(f"执行命令: {' '.join(cmd)}")
-
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=30
-        )
-
-        if result.returncode != 0:
-            logger.error(f"ipptool 执行失败: {result.stderr}")
+        # 获取打印机属性
+        attributes = get_printer_attributes(printer_url)
+        if attributes is None:
             return []
 
-        # 解析输出
-        output = result.stdout
-
         # 提取纸盒信息
-        media_sources = _parse_ipp_attribute(output, 'media-source-supported')
+        media_sources = _parse_ipp_attribute(attributes, 'media-source-supported')
 
         # 提取 printer-input-tray
-        printer_tray_info = _parse_printer_input_tray(output)
+        printer_tray_info = _parse_printer_input_tray(attributes)
 
         # 提取 media-ready
-        media_ready_match = re.search(r'media-ready\s*\([^)]+\)\s*=\s*([^\s]+)', output)
-        media_ready = media_ready_match.group(1) if media_ready_match else None
+        media_ready_values = attributes.get('media-ready', '').split()
+        media_ready = media_ready_values[0] if media_ready_values else None
 
         # 构建纸盒信息列表
         trays = []
@@ -165,13 +214,7 @@ def get_tray_info_via_ipptool(printer_url):
             status = tray_info.get('status', 'unknown')
 
             # 根据状态码映射中文状态
-            status_map = {
-                '3': '空',
-                '4': '已装载',
-                '5': '可用',
-                '6': '移除'
-            }
-            status_cn = status_map.get(status, '未知')
+            status_cn = _TRAY_STATUS_MAP.get(status, '未知')
 
             trays.append({
                 'name': name,
@@ -188,50 +231,59 @@ def get_tray_info_via_ipptool(printer_url):
         logger.error(f"获取纸盒信息失败: {e}")
         return []
 
-def _parse_ipp_attribute(output, attribute_name):
+def _parse_ipp_attributes(output):
     """
-    从 ipptool 输出中解析 IPP 属性
+    一次扫描 ipptool 输出，解析出所有 IPP 属性
 
     Args:
         output: ipptool 输出文本
+
+    Returns:
+        {属性名称: 属性值文本}，同名属性只保留第一次出现的值
+    """
+    attributes = {}
+    for match in _ATTRIBUTE_RE.finditer(output):
+        attributes.setdefault(match.group(1), match.group(2))
+    return attributes
+
+def _parse_ipp_attribute(attributes, attribute_name):
+    """
+    从已解析的属性中获取 IPP 属性值列表
+
+    Args:
+        attributes: _parse_ipp_attributes 的解析结果
         attribute_name: 属性名称
 
     Returns:
         属性值列表
     """
-    pattern = rf'{attribute_name}\s*\([^)]+\)\s*=\s*(.+)'
-    match = re.search(pattern, output)
+    values_str = attributes.get(attribute_name)
 
-    if not match:
+    if not values_str:
         logger.debug(f"未找到属性: {attribute_name}")
         return []
 
-    values_str = match.group(1)
-
     # 分割值（按逗号）
     values = [v.strip() for v in values_str.split(',')]
 
     return values
 
-def _parse_printer_input_tray(output):
+def _parse_printer_input_tray(attributes):
     """
-    从 ipptool 输出中解析 printer-input-tray
+    从已解析的属性中获取 printer-input-tray
 
     Args:
-        output: ipptool 输出文本
+        attributes: _parse_ipp_attributes 的解析结果
 
     Returns:
         纸盒信息列表
     """
-    pattern = r'printer-input-tray\s*\([^)]+\)\s*=\s*(.+)'
-    match = re.search(pattern, output)
+    values_str = attributes.get('printer-input-tray')
 
-    if not match:
+    if not values_str:
         logger.debug("未找到 printer-input-tray 属性")
         return []
 
-    values_str = match.group(1)
-
     # 分割多个纸盒（按 ;, 分隔）
     trays = []
     for tray_str in values_str.split(';,'):